@@ -3,6 +3,7 @@
 # Distributed under the MIT software license, see the accompanying
 # file COPYING or https://www.opensource.org/licenses/mit-license.php .
 
+from test_framework.authproxy import JSONRPCException
 from test_framework.test_framework import BitcoinTestFramework
 from test_framework.util import (
     BLOSSOM_BRANCH_ID,
@@ -10,15 +11,56 @@ from test_framework.util import (
     HEARTWOOD_BRANCH_ID,
     NU5_BRANCH_ID,
     NU6_BRANCH_ID,
-    assert_equal, assert_true,
+    assert_equal, assert_true, batch_rpc,
     nuparams,
-    start_node, connect_nodes, wait_and_assert_operationid_status,
+    start_nodes, connect_nodes, wait_and_assert_operationid_status,
+    wait_for,
     get_coinbase_address
 )
 from test_framework.zip317 import conventional_fee
 
 from decimal import Decimal
 
+# Network upgrade boundaries tested, as (base upgrade, upgrade, upgrade branch ID,
+# activation height). Each boundary is tested starting 5 blocks before activation,
+# and finishes 5 blocks after it.
+NETWORK_UPGRADES = [
+    ('Sapling', 'Blossom', BLOSSOM_BRANCH_ID, 200),
+    ('Blossom', 'Heartwood', HEARTWOOD_BRANCH_ID, 210),
+    ('Heartwood', 'Canopy', CANOPY_BRANCH_ID, 220),
+    ('Canopy', 'NU5', NU5_BRANCH_ID, 230),
+    ('NU5', 'NU6', NU6_BRANCH_ID, 240),
+]
+
+# Maximum block size used by the nodes. The miner reserves 1000 bytes of this
+# for the coinbase, and the remainder must be able to fit the ~2.4 kB shielded
+# Y transaction (one Sapling spend and two Sapling outputs). Blocks [H - 4..H - 1]
+# can therefore hold at most 4 * (BLOCK_MAX_SIZE - 1000) bytes of the transactions
+# used to fill the mempool, so filling it to 5 * BLOCK_MAX_SIZE bytes overflows them.
+BLOCK_MAX_SIZE = 4000
+
+# Amount sent by each transparent transaction created by the test
+SEND_AMOUNT = Decimal('0.001')
+
+# Number of sendtoaddress calls submitted per JSON-RPC batch when filling the mempool
+FILL_BATCH_SIZE = 16
+
+def sendtoaddress_batch(node, address, amount, count, txids):
+    """
+    Submit `count` sendtoaddress calls to `node` as a single JSON-RPC batch
+    request. The txids of the successful sends are appended to `txids`, and
+    then a JSONRPCException is raised if any of the sends failed.
+    """
+    errors = []
+    requests = [node.sendtoaddress.get_request(address, amount) for _ in range(count)]
+    for (txid, error) in batch_rpc(node, requests):
+        if error is None:
+            txids.append(txid)
+        else:
+            errors.append(error)
+    if len(errors) > 0:
+        raise JSONRPCException(errors[0])
+
 # Test mempool behaviour around network upgrade activation
 class MempoolUpgradeActivationTest(BitcoinTestFramework):
 
@@ -33,23 +75,42 @@ class MempoolUpgradeActivationTest(BitcoinTestFramework):
         args = [
             '-checkmempool',
             '-debug=mempool',
-            '-blockmaxsize=4000',
+            '-blockmaxsize=%d' % BLOCK_MAX_SIZE,
             '-preferredtxversion=4',
             '-allowdeprecated=getnewaddress',
             '-allowdeprecated=z_getnewaddress',
             '-allowdeprecated=z_getbalance',
-            nuparams(BLOSSOM_BRANCH_ID, 200),
-            nuparams(HEARTWOOD_BRANCH_ID, 210),
-            nuparams(CANOPY_BRANCH_ID, 220),
-            nuparams(NU5_BRANCH_ID, 230),
-            nuparams(NU6_BRANCH_ID, 240),
+        ] + [
+            nuparams(branch_id, activation_height)
+            for (_, _, branch_id, activation_height) in NETWORK_UPGRADES
         ]
-        self.nodes = []
-        self.nodes.append(start_node(0, self.options.tmpdir, args))
-        self.nodes.append(start_node(1, self.options.tmpdir, args))
+        self.nodes = start_nodes(self.num_nodes, self.options.tmpdir, [args] * self.num_nodes)
         connect_nodes(self.nodes[1], 0)
         self.is_network_split = False
-        self.sync_all
+        self.sync_all()
+
+    def fill_mempool(self, address, target_bytes=5 * BLOCK_MAX_SIZE):
+        """
+        Send transparent transactions from node 1 to `address` until node 1's
+        mempool holds at least `target_bytes` bytes, then wait for node 0 to
+        receive them. Returns the txids of the transactions that were created.
+        """
+        txids = []
+        print("Filling mempool", end="", flush=True)
+        while self.nodes[1].getmempoolinfo()['bytes'] < target_bytes:
+            sendtoaddress_batch(
+                self.nodes[1], address, SEND_AMOUNT, FILL_BATCH_SIZE, txids)
+            print(".", end="", flush=True)
+
+        # Wait for the transactions to be relayed to node 0 before
+        # requiring the mempools to be fully synced.
+        txid_set = frozenset(txids)
+        assert_true(wait_for(
+            lambda: frozenset(self.nodes[0].getrawmempool()) == txid_set, timeout=60),
+            "transactions were not relayed to node 0")
+        self.sync_all()
+        print(" done")
+        return txids
 
     def run_test(self):
         self.nodes[1].generate(100)
@@ -64,18 +125,23 @@ class MempoolUpgradeActivationTest(BitcoinTestFramework):
         node1_taddr = get_coinbase_address(self.nodes[1])
         node0_zaddr = self.nodes[0].z_getnewaddress('sapling')
         coinbase_fee = conventional_fee(3)
-        recipients = [{'address': node0_zaddr, 'amount': Decimal('10') - coinbase_fee}]
+        node0_balance = Decimal('10') - coinbase_fee
+        recipients = [{'address': node0_zaddr, 'amount': node0_balance}]
         myopid = self.nodes[1].z_sendmany(node1_taddr, recipients, 1, coinbase_fee, 'AllowRevealedSenders')
         wait_and_assert_operationid_status(self.nodes[1], myopid)
-        node0_balance = Decimal('10') - coinbase_fee
         fee = conventional_fee(2)
 
+        # Recipient of the transparent transactions created at each boundary
+        node0_taddr = self.nodes[0].getnewaddress()
+
         self.sync_all()
         self.nodes[0].generate(1)
         self.sync_all()
 
-        # Mempool checks for activation of upgrade Y at height H on base X
-        def nu_activation_checks():
+        # Mempool checks for activation of upgrade Y at height H on base X.
+        # Node 0's shielded balance is spent to itself in a Y transaction, and
+        # the resulting balance is returned.
+        def nu_activation_checks(node0_balance):
             # Start at block H - 5. After this, the mempool expects block H - 4, which is
             # the last height at which we can create transactions for X blocks (due to the
             # expiring-soon restrictions).
@@ -83,66 +149,31 @@ class MempoolUpgradeActivationTest(BitcoinTestFramework):
             # Mempool should be empty.
             assert_equal(set(self.nodes[0].getrawmempool()), set())
 
-            # Check node 0 shielded balance
-            assert_equal(self.nodes[0].z_getbalance(node0_zaddr), node0_balance)
-
             # Fill the mempool with more transactions than can fit into 4 blocks
-            # (note `-blockmaxsize=4000` in the node arguments).
-            node0_taddr = self.nodes[0].getnewaddress()
-            x_txids = []
-            print("Filling mempool", end="", flush=True)
-            while self.nodes[1].getmempoolinfo()['bytes'] < 8 * 4000:
-                x_txids.append(self.nodes[1].sendtoaddress(node0_taddr, Decimal('0.001')))
-                if len(x_txids) % 10 == 0:
-                    print(".", end="", flush=True)
-                    # this sync is important for reliability
-                    self.sync_all()
-
-            self.sync_all()
-            print(" done")
+            # (note `-blockmaxsize=BLOCK_MAX_SIZE` in the node arguments).
+            x_txids = self.fill_mempool(node0_taddr)
+            x_txids_set = frozenset(x_txids)
 
             # Spends should be in the mempool
-            x_mempool = set(self.nodes[0].getrawmempool())
-            assert_equal(x_mempool, set(x_txids))
-            assert_equal(set(self.nodes[1].getrawmempool()), set(x_txids))
-
+            assert_equal(frozenset(self.nodes[0].getrawmempool()), x_txids_set)
+            assert_equal(frozenset(self.nodes[1].getrawmempool()), x_txids_set)
+
+            # Mine blocks [H - 4..H - 1]. After each of blocks [H - 4..H - 2],
+            # the mempool expects another X block, and should not be empty.
+            # After block H - 1, the mempool expects block H, which is the
+            # first Y block.
+            block_hashes = []
+            for expect_empty_mempool in [False, False, False, True]:
+                block_hashes.extend(self.nodes[0].generate(1))
+                self.sync_all()
+                if not expect_empty_mempool:
+                    assert_true(self.nodes[0].getmempoolinfo()['size'] > 0)
+                    assert_true(self.nodes[1].getmempoolinfo()['size'] > 0)
             blocks = []
-
-            # Mine block H - 4. After this, the mempool expects
-            # block H - 3, which is an X block.
-            self.nodes[0].generate(1)
-            self.sync_all()
-            blocks.append(self.nodes[0].getblock(self.nodes[0].getbestblockhash())['tx'])
-
-            # mempool should not be empty.
-            assert_true(len(set(self.nodes[0].getrawmempool())) > 0)
-            assert_true(len(set(self.nodes[1].getrawmempool())) > 0)
-
-            # Mine block H - 3. After this, the mempool expects
-            # block H - 2, which is an X block.
-            self.nodes[0].generate(1)
-            self.sync_all()
-            blocks.append(self.nodes[0].getblock(self.nodes[0].getbestblockhash())['tx'])
-
-            # mempool should not be empty.
-            assert_true(len(set(self.nodes[0].getrawmempool())) > 0)
-            assert_true(len(set(self.nodes[1].getrawmempool())) > 0)
-
-            # Mine block H - 2. After this, the mempool expects
-            # block H - 1, which is an X block.
-            self.nodes[0].generate(1)
-            self.sync_all()
-            blocks.append(self.nodes[0].getblock(self.nodes[0].getbestblockhash())['tx'])
-
-            # mempool should not be empty.
-            assert_true(len(set(self.nodes[0].getrawmempool())) > 0)
-            assert_true(len(set(self.nodes[1].getrawmempool())) > 0)
-
-            # Mine block H - 1. After this, the mempool expects
-            # block H, which is the first Y block.
-            self.nodes[0].generate(1)
-            self.sync_all()
-            blocks.append(self.nodes[0].getblock(self.nodes[0].getbestblockhash())['tx'])
+            for (block, error) in batch_rpc(
+                    self.nodes[0], [self.nodes[0].getblock.get_request(h, 1) for h in block_hashes]):
+                assert_equal(error, None)
+                blocks.append(block['tx'])
 
             # mempool should be empty.
             assert_equal(set(self.nodes[0].getrawmempool()), set())
@@ -151,16 +182,17 @@ class MempoolUpgradeActivationTest(BitcoinTestFramework):
             # Blocks [H - 4..H - 1] should contain a subset of the original mempool
             # (with all other transactions having been dropped)
             assert(sum([len(block_txids) for block_txids in blocks]) < len(x_txids))
-            for block_txids in blocks:
-                for txid in block_txids[1:]: # Exclude coinbase
-                    assert(txid in x_txids)
+            mined_txids = set().union(*(block_txids[1:] for block_txids in blocks)) # Exclude coinbase
+            assert_equal(mined_txids - x_txids_set, set())
 
             # Create some transparent Y transactions
-            y_txids = [self.nodes[1].sendtoaddress(node0_taddr, Decimal('0.001')) for i in range(10)]
+            y_txids = []
+            sendtoaddress_batch(self.nodes[1], node0_taddr, SEND_AMOUNT, 10, y_txids)
             self.sync_all()
 
             # Create a shielded Y transaction
-            recipients = [{'address': node0_zaddr, 'amount': node0_balance - fee}]
+            y_balance = node0_balance - fee
+            recipients = [{'address': node0_zaddr, 'amount': y_balance}]
             myopid = self.nodes[0].z_sendmany(node0_zaddr, recipients, 1, fee)
             shielded = wait_and_assert_operationid_status(self.nodes[0], myopid)
             assert(shielded != None)
@@ -202,31 +234,19 @@ class MempoolUpgradeActivationTest(BitcoinTestFramework):
             self.nodes[1].generate(6)
             self.sync_all()
 
-        print('Testing Sapling -> Blossom activation boundary')
-        assert_equal(self.nodes[0].getblockcount(), 195)
-        nu_activation_checks()
-        node0_balance -= fee
-        assert_equal(self.nodes[0].getblockcount(), 205)
-
-        print('Testing Blossom -> Heartwood activation boundary')
-        nu_activation_checks()
-        node0_balance -= fee
-        assert_equal(self.nodes[0].getblockcount(), 215)
-
-        print('Testing Heartwood -> Canopy activation boundary')
-        nu_activation_checks()
-        node0_balance -= fee
-        assert_equal(self.nodes[0].getblockcount(), 225)
-
-        print('Testing Canopy -> NU5 activation boundary')
-        nu_activation_checks()
-        node0_balance -= fee
-        assert_equal(self.nodes[0].getblockcount(), 235)
-
-        print('Testing NU5 -> NU6 activation boundary')
-        nu_activation_checks()
-        node0_balance -= fee
-        assert_equal(self.nodes[0].getblockcount(), 245)
+            return y_balance
+
+        # Check node 0 shielded balance. This only needs to be done before the
+        # first boundary: each boundary checks the balance it starts from again
+        # after block H - 1 is invalidated, and later boundaries start from the
+        # balance returned by the previous one.
+        assert_equal(self.nodes[0].z_getbalance(node0_zaddr), node0_balance)
+
+        for (base, upgrade, _, activation_height) in NETWORK_UPGRADES:
+            print('Testing %s -> %s activation boundary' % (base, upgrade))
+            assert_equal(self.nodes[0].getblockcount(), activation_height - 5)
+            node0_balance = nu_activation_checks(node0_balance)
+            assert_equal(self.nodes[0].getblockcount(), activation_height + 5)
 
 if __name__ == '__main__':
     MempoolUpgradeActivationTest().main()
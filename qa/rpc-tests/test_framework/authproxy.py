@@ -105,6 +105,7 @@ class AuthServiceProxy():
         headers = {'Host': self.__url.hostname,
                    'User-Agent': USER_AGENT,
                    'Authorization': self.__auth_header,
+                   'Connection': 'keep-alive',
                    'Content-type': 'application/json'}
         try:
             self.__conn.request(method, path, postdata, headers)
@@ -113,25 +114,28 @@ class AuthServiceProxy():
             # If connection was closed, try again.
             # Python 3.5+ raises BrokenPipeError instead of BadStatusLine when the connection was reset.
             # ConnectionResetError happens on FreeBSD with Python 3.4.
-            # This can be simplified now that we depend on Python 3 (previously, we could not
-            # refer to BrokenPipeError or ConnectionResetError which did not exist on Python 2)
+            # RemoteDisconnected (a subclass of ConnectionResetError) is raised when the server
+            # closed a kept-alive connection without sending a response.
             if ((isinstance(e, BadStatusLine) and e.line == "''")
-                or e.__class__.__name__ in ('BrokenPipeError', 'ConnectionResetError')):
+                or isinstance(e, (BrokenPipeError, ConnectionResetError))):
                 self.__conn.close()
                 self.__conn.request(method, path, postdata, headers)
                 return self._get_response()
             else:
                 raise
 
-    def __call__(self, *args):
+    def get_request(self, *args):
         AuthServiceProxy.__id_count += 1
 
         log.debug("-%s-> %s %s"%(AuthServiceProxy.__id_count, self._service_name,
                                  json.dumps(args, default=EncodeDecimal)))
-        postdata = json.dumps({'version': '1.1',
-                               'method': self._service_name,
-                               'params': args,
-                               'id': AuthServiceProxy.__id_count}, default=EncodeDecimal)
+        return {'version': '1.1',
+                'method': self._service_name,
+                'params': args,
+                'id': AuthServiceProxy.__id_count}
+
+    def __call__(self, *args):
+        postdata = json.dumps(self.get_request(*args), default=EncodeDecimal)
         response = self._request('POST', self.__url.path, postdata)
         if response['error'] is not None:
             raise JSONRPCException(response['error'])
@@ -141,7 +145,7 @@ class AuthServiceProxy():
         else:
             return response['result']
 
-    def _batch(self, rpc_call_list):
+    def batch(self, rpc_call_list):
         postdata = json.dumps(list(rpc_call_list), default=EncodeDecimal)
         log.debug("--> "+postdata)
         return self._request('POST', self.__url.path, postdata)
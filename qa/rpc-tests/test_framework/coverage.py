@@ -48,13 +48,32 @@ class AuthServiceProxyWrapper(object):
 
         """
         return_val = self.auth_service_proxy_instance.__call__(*args, **kwargs)
+        self._log_call()
+        return return_val
+
+    def _log_call(self):
         rpc_method = self.auth_service_proxy_instance._service_name
 
         if self.coverage_logfile:
             with open(self.coverage_logfile, 'a+', encoding='utf8') as f:
                 f.write("%s\n" % rpc_method)
 
-        return return_val
+    def get_request(self, *args):
+        """
+        Delegates to AuthServiceProxy to build a request object suitable for
+        inclusion in a batch, and records the RPC method as called.
+
+        """
+        self._log_call()
+        return self.auth_service_proxy_instance.get_request(*args)
+
+    def batch(self, rpc_call_list):
+        """
+        Delegates to AuthServiceProxy to submit a batch of requests built
+        with get_request().
+
+        """
+        return self.auth_service_proxy_instance.batch(rpc_call_list)
 
     @property
     def url(self):
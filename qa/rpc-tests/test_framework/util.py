@@ -14,6 +14,7 @@ import sys
 
 from binascii import hexlify, unhexlify
 from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal, ROUND_DOWN
 import json
 import http.client
@@ -91,6 +92,18 @@ def get_rpc_proxy(url, node_number, timeout=None):
     return coverage.AuthServiceProxyWrapper(proxy, coverage_logfile)
 
 
+def batch_rpc(node, requests):
+    """
+    Submit `requests`, built with `node.<method>.get_request(...)`, to `node`
+    as a single JSON-RPC batch request. Returns a list of `(result, error)`
+    pairs in the same order as `requests`, where `error` is None for each
+    request that succeeded.
+    """
+    responses = dict((response['id'], response) for response in node.batch(requests))
+    assert_equal(len(responses), len(requests))
+    return [(responses[r['id']]['result'], responses[r['id']]['error']) for r in requests]
+
+
 def p2p_port(n):
     assert(n <= MAX_NODES)
     return PORT_MIN + n + (MAX_NODES * PortSeed.n) % (PORT_RANGE - 1 - MAX_NODES)
@@ -114,7 +127,20 @@ def hex_str_to_bytes(hex_str):
 def str_to_b64str(string):
     return b64encode(string.encode('utf-8')).decode('ascii')
 
-def sync_blocks(rpc_connections, wait=0.125, timeout=60, allow_different_tips=False):
+def wait_for(predicate, timeout=60, poll=0.1):
+    """
+    Poll `predicate` every `poll` seconds until it returns a true value.
+    Returns True if it did so within `timeout` seconds, and False otherwise.
+    """
+    deadline = time.time() + timeout
+    while True:
+        if predicate():
+            return True
+        if time.time() >= deadline:
+            return False
+        time.sleep(poll)
+
+def sync_blocks(rpc_connections, wait=0.1, timeout=60, allow_different_tips=False):
     """
     Wait until everybody has the same tip, and has notified
     all internal listeners of them.
@@ -122,51 +148,47 @@ def sync_blocks(rpc_connections, wait=0.125, timeout=60, allow_different_tips=Fa
     If allow_different_tips is True, waits until everyone has
     the same block count.
     """
-    while timeout > 0:
+    deadline = time.time() + timeout
+
+    def tips_match():
         if allow_different_tips:
             tips = [ x.getblockcount() for x in rpc_connections ]
         else:
             tips = [ x.getbestblockhash() for x in rpc_connections ]
-        if tips == [ tips[0] ]*len(tips):
-            break
-        time.sleep(wait)
-        timeout -= wait
+        return tips == [ tips[0] ]*len(tips)
 
-    # Now that the block counts are in sync, wait for the internal
+    # Once the block counts are in sync, wait for the internal
     # notifications to finish
-    while timeout > 0:
+    def all_notified():
         notified = [ x.getblockchaininfo()['fullyNotified'] for x in rpc_connections ]
-        if notified == [ True ] * len(notified):
-            return True
-        time.sleep(wait)
-        timeout -= wait
+        return notified == [ True ] * len(notified)
+
+    if (wait_for(tips_match, timeout, wait) and
+        wait_for(all_notified, deadline - time.time(), wait)):
+        return True
 
     raise AssertionError("Block sync failed")
 
-def sync_mempools(rpc_connections, wait=0.5, timeout=60):
+def sync_mempools(rpc_connections, wait=0.1, timeout=60):
     """
     Wait until everybody has the same transactions in their memory
     pools, and has notified all internal listeners of them
     """
-    while timeout > 0:
+    deadline = time.time() + timeout
+
+    def pools_match():
         pool = set(rpc_connections[0].getrawmempool())
-        num_match = 1
-        for i in range(1, len(rpc_connections)):
-            if set(rpc_connections[i].getrawmempool()) == pool:
-                num_match = num_match+1
-        if num_match == len(rpc_connections):
-            break
-        time.sleep(wait)
-        timeout -= wait
-
-    # Now that the mempools are in sync, wait for the internal
+        return all(set(x.getrawmempool()) == pool for x in rpc_connections[1:])
+
+    # Once the mempools are in sync, wait for the internal
     # notifications to finish
-    while timeout > 0:
+    def all_notified():
         notified = [ x.getmempoolinfo()['fullyNotified'] for x in rpc_connections ]
-        if notified == [ True ] * len(notified):
-            return True
-        time.sleep(wait)
-        timeout -= wait
+        return notified == [ True ] * len(notified)
+
+    if (wait_for(pools_match, timeout, wait) and
+        wait_for(all_notified, deadline - time.time(), wait)):
+        return True
 
     raise AssertionError("Mempool sync failed")
 
@@ -527,13 +549,22 @@ def start_nodes(num_nodes, dirname, extra_args=None, rpchost=None, binary=None):
     """
     if extra_args is None: extra_args = [ None for _ in range(num_nodes) ]
     if binary is None: binary = [ None for _ in range(num_nodes) ]
+    # The nodes start up independently, so wait for them concurrently.
+    with ThreadPoolExecutor(max_workers=max(num_nodes, 1)) as executor:
+        futures = [
+            executor.submit(start_node, i, dirname, extra_args[i], rpchost, binary=binary[i])
+            for i in range(num_nodes)]
     rpcs = []
-    try:
-        for i in range(num_nodes):
-            rpcs.append(start_node(i, dirname, extra_args[i], rpchost, binary=binary[i]))
-    except: # If one node failed to start, stop the others
+    error = None
+    for future in futures:
+        try:
+            rpcs.append(future.result())
+        except Exception as e:
+            if error is None:
+                error = e
+    if error is not None: # If one node failed to start, stop the others
         stop_nodes(rpcs)
-        raise
+        raise error
     return rpcs
 
 def node_file(dirname, n_node, filename):
@@ -689,15 +720,13 @@ def fail(message=""):
 # Returns an async operation result
 def wait_and_assert_operationid_status_result(node, myopid, in_status='success', in_errormsg=None, timeout=300):
     print('waiting for async operation {}'.format(myopid))
-    result = None
-    for _ in range(1, timeout):
-        results = node.z_getoperationresult([myopid])
-        if len(results) > 0:
-            result = results[0]
-            break
-        time.sleep(1)
-
-    assert_true(result is not None, "timeout occurred")
+    results = []
+    def operation_finished():
+        results.extend(node.z_getoperationresult([myopid]))
+        return len(results) > 0
+
+    assert_true(wait_for(operation_finished, timeout), "timeout occurred")
+    result = results[0]
     status = result['status']
 
     debug = os.getenv("PYTHON_DEBUG", "")